@@ -1,50 +1,94 @@
-import os, json, csv
+import os, io, json, csv, hashlib, threading, time
 from pathlib import Path
-from flask import Flask, request, render_template, redirect, url_for, jsonify, flash
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import Flask, request, render_template, redirect, url_for, jsonify, flash, send_file
+from flask.sessions import SecureCookieSessionInterface
 
-from utils import build_breweries_cache, parse_untappd_csv, compute_match_score
+from utils import build_breweries_cache, build_beer_index, prefix_matches, parse_untappd_csv, score_menu, write_text_atomic, UNTAPPD_PARSER_VERSION
 
 APP_ROOT = Path(__file__).parent.resolve()
 DATA_DIR = APP_ROOT / "data"
 PROFILES_DIR = DATA_DIR / "profiles"
+PROFILE_CACHE_DIR = DATA_DIR / "profile_cache"
+PROFILE_CACHE_PREFIX = f"v{UNTAPPD_PARSER_VERSION}-"
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", str(30 * 86400)))
 BREWERIES_CSV = DATA_DIR / "breweries.csv"
 BREWERIES_CACHE = DATA_DIR / "breweries_cache.json"
 BEER_CACHE_JSON = DATA_DIR / "beer_cache.json"
 
+class StaticRequestFilteringSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        if request.path.startswith(("/static/", "/api/")):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
 app = Flask(__name__)
+app.session_interface = StaticRequestFilteringSessionInterface()
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret")
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = int(os.environ.get("SEND_FILE_MAX_AGE", "3600"))
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "").strip().lower() in ("1", "true", "yes")
+
+_breweries_mem = {"mtime": None, "body": b"{}", "etag": None, "last_modified": None}
+_beer_mem = {"mtime": None, "index": {}, "names": []}
+_profile_names = {}
+_breweries_lock = threading.Lock()
+_beer_lock = threading.Lock()
 
 def ensure_breweries_cache():
     if not BREWERIES_CSV.exists():
         return False
     if (not BREWERIES_CACHE.exists()) or (BREWERIES_CSV.stat().st_mtime > BREWERIES_CACHE.stat().st_mtime):
-        rows=[]
-        with open(BREWERIES_CSV, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                rows.append({
-                    "name": r.get("name"),
-                    "city": r.get("city"),
-                    "state_province": r.get("state_province"),
-                    "country": r.get("country"),
-                    "website_url": r.get("website_url"),
-                    "longitude": r.get("longitude"),
-                    "latitude": r.get("latitude"),
-                })
-        tree = build_breweries_cache(rows)
-        BREWERIES_CACHE.write_text(json.dumps(tree, ensure_ascii=False, indent=2), encoding="utf-8")
+        with open(BREWERIES_CSV, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            tree = build_breweries_cache(reader, header)
+        write_text_atomic(BREWERIES_CACHE, json.dumps(tree, ensure_ascii=False, separators=(",", ":")))
     return True
 
-def load_breweries_cache():
-    if ensure_breweries_cache() and BREWERIES_CACHE.exists():
-        return json.loads(BREWERIES_CACHE.read_text(encoding="utf-8"))
-    return {}
-
-def load_beer_cache():
-    if BEER_CACHE_JSON.exists():
-        try: return json.loads(BEER_CACHE_JSON.read_text(encoding="utf-8"))
-        except: return {}
-    return {}
+def breweries_snapshot():
+    with _breweries_lock:
+        if not (ensure_breweries_cache() and BREWERIES_CACHE.exists()):
+            return None
+        st = BREWERIES_CACHE.stat()
+        mtime = (st.st_mtime_ns, st.st_size)
+        if _breweries_mem["mtime"] != mtime:
+            body = BREWERIES_CACHE.read_bytes()
+            _breweries_mem.update(body=body, etag=hashlib.sha1(body).hexdigest(), last_modified=st.st_mtime, mtime=mtime)
+        return dict(_breweries_mem)
+
+@lru_cache(maxsize=32)
+def _read_json(path, mtime_ns, size):
+    return json.loads(Path(path).read_bytes())
+
+def read_json_cached(path):
+    st = path.stat()
+    return _read_json(str(path), st.st_mtime_ns, st.st_size)
+
+def beer_cache_snapshot():
+    if not BEER_CACHE_JSON.exists():
+        return None
+    with _beer_lock:
+        st = BEER_CACHE_JSON.stat()
+        mtime = (st.st_mtime_ns, st.st_size)
+        if _beer_mem["mtime"] != mtime:
+            try: entries = json.loads(BEER_CACHE_JSON.read_text(encoding="utf-8"))
+            except: entries = {}
+            index = build_beer_index(entries)
+            _beer_mem.update(index=index, names=sorted(index), mtime=mtime)
+        return dict(_beer_mem)
+
+def load_beer_index():
+    snap = beer_cache_snapshot()
+    return snap["index"] if snap else {}
+
+def warm_caches():
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [ex.submit(breweries_snapshot), ex.submit(beer_cache_snapshot)]
+        return [f.result() for f in futures]
+
+if os.environ.get("WARM_CACHES", "").strip().lower() in ("1", "true", "yes"):
+    threading.Thread(target=warm_caches, daemon=True).start()
 
 @app.get("/")
 def index():
@@ -54,13 +98,31 @@ def index():
 def profile_page():
     PROFILES_DIR.mkdir(parents=True, exist_ok=True)
     profiles=[]
-    for p in PROFILES_DIR.glob("*.json"):
-        try:
-            data=json.loads(p.read_text(encoding="utf-8"))
-            profiles.append({"file": p.name, "name": data.get("name")})
-        except: pass
+    with os.scandir(PROFILES_DIR) as it:
+        for entry in it:
+            if not (entry.name.endswith(".json") and entry.is_file()):
+                continue
+            st = entry.stat()
+            key = (st.st_mtime_ns, st.st_size)
+            hit = _profile_names.get(entry.name)
+            if hit is None or hit[0] != key:
+                try:
+                    with open(entry.path, encoding="utf-8") as f:
+                        hit = (key, json.load(f).get("name"))
+                except: continue
+                _profile_names[entry.name] = hit
+            profiles.append({"file": entry.name, "name": hit[1]})
     return render_template("profile.html", profiles=profiles)
 
+def prune_profile_cache():
+    cutoff = time.time() - PROFILE_CACHE_TTL
+    for entry in os.scandir(PROFILE_CACHE_DIR):
+        try:
+            if entry.name.endswith(".json") and (not entry.name.startswith(PROFILE_CACHE_PREFIX) or entry.stat().st_mtime < cutoff):
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
 @app.post("/profile/upload")
 def profile_upload():
     file = request.files.get("csv_file")
@@ -68,7 +130,18 @@ def profile_upload():
     if not file or file.filename=="":
         flash("Please choose a CSV file to upload.")
         return redirect(url_for("profile_page"))
-    profile = parse_untappd_csv(file.stream, display_name)
+    raw = file.stream.read()
+    cached = PROFILE_CACHE_DIR / f"{PROFILE_CACHE_PREFIX}{hashlib.sha1(raw).hexdigest()}.json"
+    profile = None
+    if cached.exists():
+        try: profile = json.loads(cached.read_text(encoding="utf-8"))
+        except: profile = None
+    if profile is None:
+        profile = parse_untappd_csv(io.BytesIO(raw), display_name)
+        PROFILE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        prune_profile_cache()
+        write_text_atomic(cached, json.dumps(profile, ensure_ascii=False))
+    profile["name"] = display_name
     PROFILES_DIR.mkdir(parents=True, exist_ok=True)
     out_path = PROFILES_DIR / f"{display_name.replace(' ','_')}.json"
     out_path.write_text(json.dumps(profile, ensure_ascii=False, indent=2), encoding="utf-8")
@@ -81,7 +154,14 @@ def breweries_page():
 
 @app.get("/api/breweries")
 def api_breweries():
-    return jsonify(load_breweries_cache())
+    snap = breweries_snapshot()
+    if not snap:
+        return jsonify({})
+    resp = app.response_class(snap["body"], mimetype="application/json")
+    resp.set_etag(snap["etag"])
+    resp.last_modified = snap["last_modified"]
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 @app.get("/match")
 def match_page():
@@ -105,18 +185,13 @@ def match_run():
     if profile_file:
         p = PROFILES_DIR / profile_file
         if p.exists():
-            try: profile = json.loads(p.read_text(encoding="utf-8"))
+            try: profile = read_json_cached(p)
             except: profile = {}
 
     from untappd_scraper import fetch_venue_menu
     menu = fetch_venue_menu(venue, city, state, country)
 
-    beer_cache = load_beer_cache()
-
-    for b in menu:
-        b["match_score"] = compute_match_score(profile, b, beer_cache_lookup=beer_cache)
-
-    menu.sort(key=lambda x: x.get("match_score", 0), reverse=True)
+    score_menu(profile, menu, beer_cache_lookup=load_beer_index())
     return jsonify({"results": menu, "profile": profile})
 
 @app.get("/lookup")
@@ -125,15 +200,23 @@ def lookup_page():
 
 @app.get("/api/beer_cache")
 def api_beer_cache():
-    return jsonify(load_beer_cache())
+    q = request.args.get("q","").strip().casefold()
+    if q:
+        snap = beer_cache_snapshot()
+        if not snap:
+            return jsonify([])
+        index = snap["index"]
+        hit = index.get(q)
+        return jsonify((([hit] if hit else []) + [index[k] for k in prefix_matches(snap["names"], q) if k != q])[:20])
+    if not BEER_CACHE_JSON.exists():
+        return jsonify({})
+    return send_file(BEER_CACHE_JSON, mimetype="application/json", conditional=True)
 
 @app.get("/map")
 def map_redirect():
     lat = request.args.get("lat"); lon = request.args.get("lon"); q = request.args.get("q","Brewery")
     if lat and lon:
-        from flask import redirect
         return redirect(f"https://www.google.com/maps/search/?api=1&query={lat}%2C{lon}")
-    from flask import redirect
     return redirect(f"https://www.google.com/maps/search/{q}")
 
 if __name__ == "__main__":
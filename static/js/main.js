@@ -48,7 +48,7 @@ async function loadBreweriesTree() {
     resetSelect($venue,'Venue');
     const c = $country.value; const s = $state.value; const ci = $city.value;
     const venues = (((tree[c]||{})[s]||{})[ci]) || [];
-    venues.sort((a,b)=> a.name.localeCompare(b.name)).forEach(v => {
+    venues.forEach(v => {
       const opt = document.createElement('option');
       opt.value = v.name; opt.textContent = v.name;
       opt.dataset.lat = v.latitude; opt.dataset.lon = v.longitude; opt.dataset.website = v.website_url || '';
@@ -103,8 +103,11 @@ async function matchPageInit() {
 async function lookupInit() {
   const btn = document.getElementById('loadCache');
   const out = document.getElementById('cacheOut');
+  const input = document.getElementById('beer_query');
   btn?.addEventListener('click', async () => {
-    const res = await fetch('/api/beer_cache');
+    const q = (input?.value || '').trim();
+    if (!q) { out.textContent = ''; return; }
+    const res = await fetch(`/api/beer_cache?q=${encodeURIComponent(q)}`);
     const data = await res.json();
     out.textContent = JSON.stringify(data, null, 2);
   });
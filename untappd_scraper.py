@@ -1,17 +1,93 @@
-import requests, re
-from typing import List, Dict
-from bs4 import BeautifulSoup
+import requests, re, os, json, time, hashlib
+import soupsieve as sv
+from pathlib import Path
+from typing import List, Dict, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import write_text_atomic
+
+MENU_CACHE_DIR = Path(__file__).parent.resolve() / "data" / "menu_cache"
+MENU_CACHE_TTL = int(os.environ.get("MENU_CACHE_TTL", "3600"))
+SEARCH_TIMEOUT = (3, 6)
+VENUE_TIMEOUT = (3, 8)
+
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=1, connect=1, read=0, status=0, backoff_factor=0.3, respect_retry_after_header=False))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+ABV_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*ABV", re.I)
+IBU_RE = re.compile(r"(\d+)\s*IBU", re.I)
+
+MENU_ITEM_SEL = sv.compile("li.menu-item, li[data-menu-item], div.menu-item")
+ITEM_NAME_SEL = sv.compile(".beer-name, .name, .beer, h4")
+ITEM_STYLE_SEL = sv.compile(".style, .beer-style, .caps")
+MENU_ROW_SEL = sv.compile("ul.menu-section-list li, div.beer-info")
+ROW_NAME_SEL = sv.compile(".beer-name, .name, h4")
+ROW_STYLE_SELS = tuple(sv.compile(c) for c in (".style", ".beer-style", ".caps"))
+
+def _menu_cache_path(query: str) -> Path:
+    return MENU_CACHE_DIR / f"{hashlib.sha1(query.lower().encode('utf-8')).hexdigest()}.json"
+
+def _read_cached_menu(query: str) -> Optional[List[Dict]]:
+    p = _menu_cache_path(query)
+    try:
+        if time.time() - p.stat().st_mtime < MENU_CACHE_TTL:
+            return json.loads(p.read_text(encoding="utf-8"))
+        p.unlink()
+    except Exception:
+        pass
+    return None
+
+def _prune_menu_cache() -> None:
+    cutoff = time.time() - MENU_CACHE_TTL
+    for entry in os.scandir(MENU_CACHE_DIR):
+        try:
+            if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+def _write_cached_menu(query: str, beers: List[Dict]) -> None:
+    p = _menu_cache_path(query)
+    try:
+        MENU_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _prune_menu_cache()
+        write_text_atomic(p, json.dumps(beers, ensure_ascii=False))
+    except Exception:
+        pass
 
 def fetch_venue_menu(venue_name: str, city: str, state: str, country: str) -> List[Dict]:
     query = " ".join([venue_name, city, state, country]).strip()
     if not query: return []
+    cached = _read_cached_menu(query)
+    if cached is not None: return cached
+    beers = _scrape_venue_menu(query)
+    if beers: _write_cached_menu(query, beers)
+    return beers
+
+def _menu_entry(name: str, style: Optional[str], txt: str) -> Dict:
+    abv=None; ibu=None
+    mabv = ABV_RE.search(txt)
+    if mabv:
+        try: abv=float(mabv.group(1))
+        except: pass
+    mibu = IBU_RE.search(txt)
+    if mibu:
+        try: ibu=float(mibu.group(1))
+        except: pass
+    return {"name":name,"style":style,"abv":abv,"ibu":ibu}
+
+def _scrape_venue_menu(query: str) -> List[Dict]:
     search_url = "https://www.bing.com/search"
     try:
-        resp = requests.get(search_url, params={"q": f"site:untappd.com {query}"}, timeout=10)
+        resp = SESSION.get(search_url, params={"q": f"site:untappd.com {query}"}, timeout=SEARCH_TIMEOUT)
         resp.raise_for_status()
     except Exception:
         return []
-    soup = BeautifulSoup(resp.text, "lxml")
+    soup = BeautifulSoup(resp.content, "lxml", parse_only=SoupStrainer("a", href=True))
     venue_link=None
     for a in soup.select("a"):
         href = a.get("href","")
@@ -20,51 +96,31 @@ def fetch_venue_menu(venue_name: str, city: str, state: str, country: str) -> Li
     if not venue_link:
         return []
     try:
-        v = requests.get(venue_link, timeout=12)
+        v = SESSION.get(venue_link, timeout=VENUE_TIMEOUT)
         v.raise_for_status()
     except Exception:
         return []
-    vsoup = BeautifulSoup(v.text, "lxml")
+    vsoup = BeautifulSoup(v.content, "lxml")
     beers=[]
-    for li in vsoup.select("li.menu-item, li[data-menu-item], div.menu-item"):
-        name_el = li.select_one(".beer-name, .name, .beer, h4")
+    for li in MENU_ITEM_SEL.select(vsoup):
+        name_el = ITEM_NAME_SEL.select_one(li)
         name = name_el.get_text(strip=True) if name_el else None
-        style_el = li.select_one(".style, .beer-style, .caps")
+        style_el = ITEM_STYLE_SEL.select_one(li)
         style = style_el.get_text(strip=True) if style_el else None
-        txt = li.get_text(" ", strip=True)
-        abv = None; ibu=None
-        mabv = re.search(r"(\\d+(?:\\.\\d+)?)\\s*%\\s*ABV", txt, re.I)
-        if mabv:
-            try: abv=float(mabv.group(1))
-            except: pass
-        mibu = re.search(r"(\\d+)\\s*IBU", txt, re.I)
-        if mibu:
-            try: ibu=float(mibu.group(1))
-            except: pass
         if name:
-            beers.append({"name":name,"style":style,"abv":abv,"ibu":ibu})
+            beers.append(_menu_entry(name, style, li.get_text(" ", strip=True)))
     if beers: return beers
-    for row in vsoup.select("ul.menu-section-list li, div.beer-info"):
-        txt = row.get_text(" ", strip=True)
+    for row in MENU_ROW_SEL.select(vsoup):
         name=None
-        name_el = row.select_one(".beer-name, .name, h4")
+        name_el = ROW_NAME_SEL.select_one(row)
         if name_el: name=name_el.get_text(strip=True)
         else:
             tag=row.find(["strong","b"])
             name = tag.get_text(strip=True) if tag else None
         style=None
-        for cls in (".style",".beer-style",".caps"):
-            el=row.select_one(cls)
+        for sel in ROW_STYLE_SELS:
+            el=sel.select_one(row)
             if el: style = el.get_text(strip=True); break
-        abv=None; ibu=None
-        mabv = re.search(r"(\\d+(?:\\.\\d+)?)\\s*%\\s*ABV", txt, re.I)
-        if mabv:
-            try: abv=float(mabv.group(1))
-            except: pass
-        mibu = re.search(r"(\\d+)\\s*IBU", txt, re.I)
-        if mibu:
-            try: ibu=float(mibu.group(1))
-            except: pass
         if name:
-            beers.append({"name":name,"style":style,"abv":abv,"ibu":ibu})
+            beers.append(_menu_entry(name, style, row.get_text(" ", strip=True)))
     return beers
@@ -1,87 +1,153 @@
 import csv
-import json
-from collections import Counter, defaultdict
-from statistics import mean
-from typing import Dict, Any, List, Optional
+import io
+import os
+import tempfile
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, Any, Iterable, List, Optional
+
+UNTAPPD_PARSER_VERSION = 1
 
 def parse_untappd_csv(file_obj, display_name: str) -> Dict[str, Any]:
     file_obj.seek(0)
-    reader = csv.DictReader((line.decode("utf-8") if isinstance(line, bytes) else line for line in file_obj))
-    styles = Counter(); abvs=[]; ibus=[]; breweries=Counter(); ratings=[]; global_ratings=[]
+    if isinstance(file_obj, io.TextIOBase):
+        return _summarize_untappd_rows(csv.reader(file_obj), display_name)
+    text = io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline="")
+    try:
+        return _summarize_untappd_rows(csv.reader(text), display_name)
+    finally:
+        text.detach()
+
+_BLANKS = frozenset(("", "null", "NULL", "N/A", "n/a", "-"))
+
+def _to_float(v) -> Optional[float]:
+    if not v or v in _BLANKS: return None
+    try: return float(v)
+    except ValueError: return None
+
+def _summarize_untappd_rows(reader, display_name: str) -> Dict[str, Any]:
+    styles = Counter(); breweries=Counter()
+    abv_sum=ibu_sum=rating_sum=global_sum=0.0; abv_n=ibu_n=rating_n=global_n=0
+    header = next(reader, [])
+    cols = ["beer_type","beer_abv","beer_ibu","brewery_name","rating_score","global_rating_score"]
+    pick = itemgetter(*[header.index(c) if c in header else len(header) for c in cols])
+    width = len(header) + 1
     for row in reader:
-        bt = (row.get("beer_type") or "").strip()
+        if len(row) < width: row = row + [""] * (width - len(row))
+        bt, abv, ibu, bname, r, gr = pick(row)
+        bt = bt.strip()
         if bt: styles[bt]+=1
-        try:
-            abv = float(row.get("beer_abv") or 0); 
-            if abv>0: abvs.append(abv)
-        except: pass
-        try:
-            ibu = float(row.get("beer_ibu") or 0); 
-            if ibu>0: ibus.append(ibu)
-        except: pass
-        bname = (row.get("brewery_name") or "").strip()
+        abv = _to_float(abv)
+        if abv and abv>0: abv_sum+=abv; abv_n+=1
+        ibu = _to_float(ibu)
+        if ibu and ibu>0: ibu_sum+=ibu; ibu_n+=1
+        bname = bname.strip()
         if bname: breweries[bname]+=1
-        try:
-            r = float(row.get("rating_score") or 0); 
-            if r>0: ratings.append(r)
-        except: pass
-        try:
-            gr = float(row.get("global_rating_score") or 0); 
-            if gr>0: global_ratings.append(gr)
-        except: pass
-    top_styles = [{"style": s, "count": c} for s,c in styles.most_common(5)]
-    top_breweries = [{"brewery": b, "count": c} for b,c in breweries.most_common(5)]
+        r = _to_float(r)
+        if r and r>0: rating_sum+=r; rating_n+=1
+        gr = _to_float(gr)
+        if gr and gr>0: global_sum+=gr; global_n+=1
     return {
         "name": display_name,
-        "styles": {ts["style"]: ts["count"] for ts in top_styles},
+        "styles": dict(styles.most_common(5)),
         "stats": {
-            "abv_mean": round(mean(abvs),2) if abvs else None,
-            "ibu_mean": round(mean(ibus),1) if ibus else None,
-            "user_rating_mean": round(mean(ratings),2) if ratings else None,
-            "global_rating_mean": round(mean(global_ratings),2) if global_ratings else None,
+            "abv_mean": round(abv_sum/abv_n,2) if abv_n else None,
+            "ibu_mean": round(ibu_sum/ibu_n,1) if ibu_n else None,
+            "user_rating_mean": round(rating_sum/rating_n,2) if rating_n else None,
+            "global_rating_mean": round(global_sum/global_n,2) if global_n else None,
         },
-        "top_breweries": top_breweries
+        "top_breweries": [{"brewery": b, "count": c} for b,c in breweries.most_common(5)]
     }
 
-def compute_match_score(profile: Dict[str, Any], beer: Dict[str, Any], beer_cache_lookup: Optional[Dict[str, Any]] = None) -> float:
-    score=0.0
+def make_scorer(profile: Dict[str, Any], beer_cache_lookup: Optional[Dict[str, Any]] = None):
     styles = profile.get("styles", {})
     stats = profile.get("stats", {})
-    style = (beer.get("style") or "").strip()
-    abv = beer.get("abv"); ibu = beer.get("ibu")
-    global_rating=None
-    if beer_cache_lookup:
-        bname = (beer.get("name") or "").strip().lower()
-        cache = beer_cache_lookup.get(bname)
-        if isinstance(cache, dict):
-            gr = cache.get("global_rating") or cache.get("global_rating_score")
-            try: global_rating=float(gr)
-            except: pass
-    if style and style in styles:
-        score += 10.0 + styles[style]
-    if isinstance(abv,(int,float)) and stats.get("abv_mean"):
-        score += max(0, 5.0 - abs(abv - stats["abv_mean"]))
-    if isinstance(ibu,(int,float)) and stats.get("ibu_mean"):
-        score += max(0, 5.0 - abs(ibu - stats["ibu_mean"])/5.0)
-    if global_rating and global_rating>=3.5:
-        score += (global_rating - 3.5)*2.0
-    return round(score,2)
+    abv_mean = stats.get("abv_mean"); ibu_mean = stats.get("ibu_mean")
+    def score_beer(beer: Dict[str, Any]) -> float:
+        score=0.0
+        style = (beer.get("style") or "").strip()
+        abv = beer.get("abv"); ibu = beer.get("ibu")
+        global_rating=None
+        if beer_cache_lookup:
+            bname = (beer.get("name") or "").strip().casefold()
+            cache = beer_cache_lookup.get(bname)
+            if isinstance(cache, dict):
+                gr = cache.get("global_rating") or cache.get("global_rating_score")
+                try: global_rating=float(gr)
+                except: pass
+        if style and style in styles:
+            score += 10.0 + styles[style]
+        if isinstance(abv,(int,float)) and abv_mean:
+            score += max(0, 5.0 - abs(abv - abv_mean))
+        if isinstance(ibu,(int,float)) and ibu_mean:
+            score += max(0, 5.0 - abs(ibu - ibu_mean)/5.0)
+        if global_rating and global_rating>=3.5:
+            score += (global_rating - 3.5)*2.0
+        return round(score,2)
+    return score_beer
 
-def build_breweries_cache(rows: List[Dict[str, str]]) -> Dict[str, Any]:
-    from collections import defaultdict
-    tree = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+def compute_match_score(profile: Dict[str, Any], beer: Dict[str, Any], beer_cache_lookup: Optional[Dict[str, Any]] = None) -> float:
+    return make_scorer(profile, beer_cache_lookup)(beer)
+
+def score_menu(profile: Dict[str, Any], menu: List[Dict[str, Any]], beer_cache_lookup: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    score_beer = make_scorer(profile, beer_cache_lookup)
+    for b in menu:
+        b["match_score"] = score_beer(b)
+    menu.sort(key=lambda x: x["match_score"], reverse=True)
+    return menu
+
+def build_beer_index(entries) -> Dict[str, Any]:
+    if isinstance(entries, dict):
+        items = entries.items()
+    else:
+        items = (((b.get("name") or ""), b) for b in entries or [] if isinstance(b, dict))
+    index = {}
+    for name, b in items:
+        key = name.strip().casefold()
+        if key and key not in index:
+            index[key] = b
+    return index
+
+def prefix_matches(sorted_keys: List[str], prefix: str, limit: int = 20) -> List[str]:
+    out = []
+    for i in range(bisect_left(sorted_keys, prefix), len(sorted_keys)):
+        k = sorted_keys[i]
+        if not k.startswith(prefix) or len(out) >= limit:
+            break
+        out.append(k)
+    return out
+
+def build_breweries_cache(rows: Iterable[List[str]], header: List[str]) -> Dict[str, Any]:
+    buckets = {}
+    cols = ["country","state_province","city","name","website_url","longitude","latitude"]
+    pick = itemgetter(*[header.index(c) if c in header else len(header) for c in cols])
+    width = len(header) + 1
     for r in rows:
-        country = (r.get("country") or "").strip() or "Unknown"
-        state = (r.get("state_province") or "").strip()
-        city = (r.get("city") or "").strip()
-        name = (r.get("name") or "").strip()
-        website = (r.get("website_url") or "").strip()
-        lon = r.get("longitude"); lat = r.get("latitude")
-        try: lon = float(lon) if lon not in (None,"","null") else None
-        except: lon=None
-        try: lat = float(lat) if lat not in (None,"","null") else None
-        except: lat=None
+        if len(r) < width: r = r + [""] * (width - len(r))
+        country, state, city, name, website, lon, lat = pick(r)
+        country = country.strip() or "Unknown"
+        state = state.strip(); city = city.strip(); name = name.strip(); website = website.strip()
         if not (name and city and country): 
             continue
-        tree[country][state][city].append({"name":name,"website_url":website or None,"longitude":lon,"latitude":lat})
+        lon = _to_float(lon); lat = _to_float(lat)
+        key = (country, state, city)
+        venues = buckets.get(key)
+        if venues is None: buckets[key] = venues = []
+        venues.append({"name":name,"website_url":website or None,"longitude":lon,"latitude":lat})
+    tree = {}
+    for (country, state, city), venues in sorted(buckets.items()):
+        venues.sort(key=lambda v: v["name"].casefold())
+        tree.setdefault(country, {}).setdefault(state, {})[city] = venues
     return tree
+
+def write_text_atomic(path, text):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise